@@ -8,7 +8,12 @@ from dotenv import load_dotenv
 import pandas as pd
 from openai import AzureOpenAI
 import os
+import sys
+from pathlib import Path
 
+# The prompt template registry lives in the repository's scripts/ folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+from prompt_templates import TemplateRegistry
 
 load_dotenv()
 
@@ -21,6 +26,10 @@ client = AzureOpenAI(
   api_key=AZURE_OPENAI_KEY,  
   api_version="2024-10-21"
 )
+# Load and validate the food-order template once at startup instead of per call
+PROMPTS = TemplateRegistry(model=AZURE_OPENAI_MODEL)
+PROMPTS.load_file(Path(__file__).resolve().parent / "data" / "prompts" / "food-order.txt")
+
 SPEECH_KEY = os.getenv("SPEECH_KEY")
 SPEECH_REGION = os.getenv("SPEECH_REGION")
 
@@ -39,58 +48,9 @@ def voice_to_text():
     return speech_recognition_result.text
 
 def call_openAI(text):
-
-    system_message = """
-You are an assistant designed to extract entities from a food order transcript. 
-Users will enter in a string of text and you will respond with entities you've extracted from the text as a JSON object. 
-Here's an example of your output format:
-[  
-    {    
-        main: {      
-            type: "vegan burger",
-            size: "large",
-            cooking_degree: "medium",
-            toppings: [        
-                {
-                    type: "lettuce",
-                    quantity: 1,
-                    size: "small"
-                },        
-                {
-                    type: "tomato",
-                    quantity: 1,
-                    size: ""        
-                },        
-                {
-                    type: "onion",
-                    quantity: 2,
-                    size: ""
-                }      
-            ]
-        },
-        drinks: {
-            type: "pepsi cola",
-            size: "large",
-            additionals: [
-                {
-                    type: "ice",
-                    quantity: 1,
-                    size: "small"
-                },
-                {
-                    type: "lemon",
-                    quantity: 1,
-                    size: ""
-                }  
-            ]
-        }  
-    }
-]
-"""
-
-    message_text = [
-        {"role":"system","content":system_message},
-        {"role":"user","content":text}]
+    # The static entity-extraction instructions come first and the transcript last,
+    # so the rendered prompt keeps a stable, cacheable prefix
+    message_text = PROMPTS.render("food-order", transcript=text)
     response = client.chat.completions.create(
         model=AZURE_OPENAI_MODEL,
         messages = message_text,
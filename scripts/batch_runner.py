@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+Offline Batch Request Runner for Azure OpenAI Workshop
+Streams a JSONL file of chat requests through a bounded async worker pool with
+per-deployment rate limits, retries, ordered output and resumable checkpoints.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from token_accounting import count_chat_tokens
+
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError'}
+BATCH_API_URL = '/chat/completions'
+
+
+@dataclass
+class BatchRequest:
+    """A single chat completion request read from the input file"""
+    index: int
+    custom_id: str
+    deployment: str
+    body: Dict[str, Any]
+    error: Optional[str] = None     # set for input lines that could not be parsed
+
+
+@dataclass
+class RunStats:
+    """Counters collected while a batch is running"""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> Dict[str, Any]:
+        """Throughput and error-rate summary for the run"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        total_tokens = self.prompt_tokens + self.completion_tokens
+        return {
+            'requests': self.total,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped_from_checkpoint': self.skipped,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'elapsed_seconds': round(elapsed, 3),
+            'requests_per_second': round(self.total / elapsed, 3),
+            'tokens_per_second': round(total_tokens / elapsed, 3),
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'error_rate': round(self.failed / self.total, 4) if self.total else 0.0,
+            'rate_limit_rate': round(self.rate_limited / self.total, 4) if self.total else 0.0,
+        }
+
+
+class RateLimiter:
+    """Token-bucket limiter for one deployment (requests and tokens per minute)"""
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._request_allowance = float(requests_per_minute or 0)
+        self._token_allowance = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._request_allowance = min(self.rpm, self._request_allowance + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_allowance = min(self.tpm, self._token_allowance + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request costing ``tokens`` fits in the budget"""
+        if not self.rpm and not self.tpm:
+            return
+        # A single request larger than the whole per-minute budget still has to go out
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        async with self._lock:
+            while True:
+                self._refill()
+                waits = []
+                if self.rpm and self._request_allowance < 1:
+                    waits.append((1 - self._request_allowance) * 60 / self.rpm)
+                if self.tpm and self._token_allowance < tokens:
+                    waits.append((tokens - self._token_allowance) * 60 / self.tpm)
+                if not waits:
+                    break
+                await asyncio.sleep(max(waits))
+            if self.rpm:
+                self._request_allowance -= 1
+            if self.tpm:
+                self._token_allowance -= tokens
+
+
+_tokenizer_available = True
+
+
+def approximate_request_tokens(body: Dict[str, Any]) -> int:
+    """Cheap prompt + completion estimate from character counts (about 4 characters per token)"""
+    chars = 0
+    for message in body.get('messages', []):
+        content = message.get('content') or ''
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+        chars += len(str(content))
+    max_tokens = body.get('max_tokens') or body.get('max_completion_tokens') or 0
+    return chars // 4 + 4 * len(body.get('messages', [])) + max_tokens
+
+
+def estimate_request_tokens(body: Dict[str, Any]) -> int:
+    """Prompt + completion token estimate used for TPM budgeting
+
+    Uses the tokenizer when it can be loaded and falls back to the character
+    heuristic otherwise (e.g. offline, where tiktoken cannot fetch its encodings).
+    """
+    global _tokenizer_available
+    if _tokenizer_available:
+        try:
+            max_tokens = body.get('max_tokens') or body.get('max_completion_tokens') or 0
+            return count_chat_tokens(body.get('messages', []), body.get('model')) + max_tokens
+        except Exception as e:
+            _tokenizer_available = False
+            print(f"Warning: tokenizer unavailable ({type(e).__name__}); estimating tokens from character counts")
+    return approximate_request_tokens(body)
+
+
+def parse_request(index: int, line: str, default_deployment: Optional[str]) -> BatchRequest:
+    """Parse one input line; accepts plain chat bodies or Batch API entries"""
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Line {index + 1}: invalid JSON ({e.msg} at character {e.pos + 1})") from None
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {index + 1}: expected a JSON object")
+    body = dict(record['body']) if 'body' in record else {k: v for k, v in record.items() if k != 'custom_id'}
+    deployment = body.get('model') or default_deployment
+    if not deployment:
+        raise ValueError(f"Line {index + 1}: no 'model' in request and no default deployment given")
+    if 'messages' not in body:
+        raise ValueError(f"Line {index + 1}: request has no 'messages'")
+    body['model'] = deployment
+    return BatchRequest(
+        index=index,
+        custom_id=str(record.get('custom_id', f'request-{index}')),
+        deployment=deployment,
+        body=body,
+    )
+
+
+def iter_requests(
+    input_path: Path,
+    default_deployment: Optional[str],
+    start: int = 0,
+    keep_invalid: bool = False,
+) -> Iterator[BatchRequest]:
+    """Stream requests from a JSONL file, skipping the first ``start`` entries
+
+    Invalid lines raise ValueError, or with ``keep_invalid`` are yielded as
+    requests carrying an ``error`` so the caller can record them and continue.
+    """
+    index = 0
+    with open(input_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if index >= start:
+                try:
+                    yield parse_request(index, line, default_deployment)
+                except ValueError as e:
+                    if not keep_invalid:
+                        raise
+                    yield BatchRequest(index=index, custom_id=f'request-{index}', deployment='', body={}, error=str(e))
+            index += 1
+
+
+def to_batch_api_format(input_path: Path, output_path: Path, default_deployment: Optional[str]) -> int:
+    """Rewrite a request file into the Azure OpenAI Batch API input format"""
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for request in iter_requests(input_path, default_deployment):
+            out.write(json.dumps({
+                'custom_id': request.custom_id,
+                'method': 'POST',
+                'url': BATCH_API_URL,
+                'body': request.body,
+            }) + '\n')
+            count += 1
+    return count
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient network failures, timeouts, 429s and 5xx responses are retried"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Read the server-suggested delay from a 429/503 response, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        return None
+    return None
+
+
+class Checkpoint:
+    """Sidecar file recording how many ordered results of one input file are safely on disk"""
+
+    def __init__(self, output_path: Path, input_path: Path):
+        self.path = output_path.with_name(output_path.name + '.ckpt')
+        self.output_path = output_path
+        self.input_path = input_path
+
+    def fingerprint(self) -> Dict[str, Any]:
+        stat = self.input_path.stat()
+        return {'path': str(self.input_path.resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def load(self) -> Tuple[int, int]:
+        """Return (completed_requests, output_byte_offset); refuses checkpoints of another input"""
+        if not self.path.exists():
+            return 0, 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('input') != self.fingerprint():
+            raise ValueError(
+                f"Checkpoint {self.path} was written for a different or modified input file. "
+                f"Rerun with --no-resume to start over."
+            )
+        # Truncating a shorter file to the offset would pad it with NUL bytes
+        if not self.output_path.exists() or self.output_path.stat().st_size < data['offset']:
+            raise ValueError(
+                f"Output {self.output_path} is shorter than checkpoint {self.path} records. "
+                f"Rerun with --no-resume to start over."
+            )
+        return data['completed'], data['offset']
+
+    def save(self, completed: int, offset: int):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'input': self.fingerprint(), 'completed': completed, 'offset': offset}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+
+SendFunction = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class BatchRunner:
+    """Runs a request file with bounded concurrency and writes results in input order"""
+
+    def __init__(
+        self,
+        send: SendFunction,
+        concurrency: int = 8,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        rate_limits: Optional[Dict[str, Dict[str, int]]] = None,
+        default_rate_limit: Optional[Dict[str, int]] = None,
+        checkpoint_every: int = 10,
+    ):
+        self.send = send
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = rate_limits or {}
+        self.default_rate_limit = default_rate_limit or {}
+        self.checkpoint_every = checkpoint_every
+        self._limiters: Dict[str, RateLimiter] = {}
+        self.stats = RunStats()
+
+    def limiter_for(self, deployment: str) -> RateLimiter:
+        if deployment not in self._limiters:
+            limits = self.rate_limits.get(deployment, self.default_rate_limit)
+            self._limiters[deployment] = RateLimiter(limits.get('rpm'), limits.get('tpm'))
+        return self._limiters[deployment]
+
+    async def execute(self, request: BatchRequest) -> Dict[str, Any]:
+        """Send one request with rate limiting and retries; never raises"""
+        if request.error:
+            self.stats.failed += 1
+            return {
+                'custom_id': request.custom_id,
+                'response': None,
+                'error': {'type': 'InvalidRequestLine', 'status_code': None, 'message': request.error},
+                'attempts': 0,
+            }
+        limiter = self.limiter_for(request.deployment)
+        estimated_tokens = estimate_request_tokens(request.body)
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated_tokens)
+            try:
+                response = await self.send(request.body)
+                usage = response.get('usage') or {}
+                self.stats.prompt_tokens += usage.get('prompt_tokens', 0)
+                self.stats.completion_tokens += usage.get('completion_tokens', 0)
+                self.stats.succeeded += 1
+                return {'custom_id': request.custom_id, 'response': response, 'error': None, 'attempts': attempt + 1}
+            except Exception as e:
+                if getattr(e, 'status_code', None) == 429:
+                    self.stats.rate_limited += 1
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.stats.failed += 1
+                    return {
+                        'custom_id': request.custom_id,
+                        'response': None,
+                        'error': {'type': type(e).__name__, 'status_code': getattr(e, 'status_code', None), 'message': str(e)},
+                        'attempts': attempt + 1,
+                    }
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                else:
+                    # Honour the server hint up to backoff_max; jitter upwards only so workers
+                    # that were throttled together do not all retry at the same instant
+                    delay = min(self.backoff_max, delay) * random.uniform(1.0, 1.25)
+                attempt += 1
+                self.stats.retries += 1
+                await asyncio.sleep(delay)
+
+    async def run(
+        self,
+        input_path: Path,
+        output_path: Path,
+        default_deployment: Optional[str] = None,
+        resume: bool = True,
+    ) -> Dict[str, Any]:
+        """Process ``input_path`` into ``output_path`` and return the run summary"""
+        checkpoint = Checkpoint(output_path, input_path)
+        completed, offset = checkpoint.load() if resume and output_path.exists() else (0, 0)
+        self.stats = RunStats(skipped=completed)
+
+        # Drop any partially written tail left behind by an interrupted run
+        out = open(output_path, 'r+b' if offset else 'wb')
+        out.truncate(offset)
+        out.seek(offset)
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        # Bounds how far workers may run ahead of the next result still owed to the output
+        window = asyncio.Semaphore(self.concurrency * 4)
+        pending: Dict[int, Dict[str, Any]] = {}
+        next_index = completed
+
+        def flush():
+            nonlocal next_index
+            flushed = 0
+            while next_index in pending:
+                out.write((json.dumps(pending.pop(next_index)) + '\n').encode('utf-8'))
+                next_index += 1
+                flushed += 1
+                window.release()
+            if flushed:
+                out.flush()
+                if next_index % self.checkpoint_every < flushed or not pending:
+                    checkpoint.save(next_index, out.tell())
+
+        async def produce():
+            for request in iter_requests(input_path, default_deployment, start=completed, keep_invalid=True):
+                await window.acquire()
+                await queue.put(request)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                request = await queue.get()
+                if request is None:
+                    return
+                result = await self.execute(request)
+                self.stats.total += 1
+                pending[request.index] = result
+                flush()
+
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+        except BaseException:
+            flush()
+            checkpoint.save(next_index, out.tell())
+            raise
+        else:
+            # Every line is written, so there is nothing left to resume
+            checkpoint.clear()
+        finally:
+            out.close()
+
+        return self.stats.summary()
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """Chat-completions endpoint that echoes prompts and injects 429s"""
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+
+        if not self.path.split('?')[0].endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        if random.random() < server.error_rate:
+            payload = json.dumps({'error': {'code': '429', 'message': 'Rate limit is exceeded (mock).'}}).encode('utf-8')
+            self.send_response(429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Retry-After-Ms', '50')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        last_message = (body.get('messages') or [{}])[-1].get('content', '')
+        prompt_tokens = approximate_request_tokens({'messages': body.get('messages', [])})
+        content = f'Echo: {last_message}'
+        payload = json.dumps({
+            'id': f'chatcmpl-mock-{random.randint(0, 10**9)}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(content) // 4,
+                'total_tokens': prompt_tokens + len(content) // 4,
+            },
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_server(port: int = 0, error_rate: float = 0.0, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Start a local mock Azure OpenAI server in a background thread"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), _MockHandler)
+    server.error_rate = error_rate
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_openai_sender(endpoint: str, api_key: Optional[str], api_version: str) -> SendFunction:
+    """Create a send function backed by AsyncAzureOpenAI (retries are handled by the runner)"""
+    from openai import AsyncAzureOpenAI
+
+    if api_key:
+        client = AsyncAzureOpenAI(azure_endpoint=endpoint, api_key=api_key, api_version=api_version, max_retries=0)
+    else:
+        from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+        token_provider = get_bearer_token_provider(DefaultAzureCredential(), 'https://cognitiveservices.azure.com/.default')
+        client = AsyncAzureOpenAI(
+            azure_endpoint=endpoint,
+            azure_ad_token_provider=token_provider,
+            api_version=api_version,
+            max_retries=0,
+        )
+
+    async def send(body: Dict[str, Any]) -> Dict[str, Any]:
+        response = await client.chat.completions.create(**body)
+        return response.model_dump()
+
+    return send
+
+
+def parse_rate_limits(values: List[str]) -> Dict[str, Dict[str, int]]:
+    """Parse ``deployment=rpm:tpm`` flags into a limits mapping"""
+    limits = {}
+    for value in values:
+        deployment, _, spec = value.partition('=')
+        rpm, _, tpm = spec.partition(':')
+        limits[deployment] = {'rpm': int(rpm) if rpm else None, 'tpm': int(tpm) if tpm else None}
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a JSONL file of chat completion requests')
+    parser.add_argument('input', help='Input JSONL file (one chat request per line)')
+    parser.add_argument('--output', '-o', help='Output JSONL file (default: <input>.results.jsonl)')
+    parser.add_argument('--deployment', default=os.getenv('AZURE_OPENAI_DEPLOYMENT_NAME'), help='Default deployment for requests without a model')
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum requests in flight')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries for transient and 429 errors')
+    parser.add_argument('--rpm', type=int, help='Default requests-per-minute limit per deployment')
+    parser.add_argument('--tpm', type=int, help='Default tokens-per-minute limit per deployment')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='DEPLOYMENT=RPM:TPM', help='Per-deployment limits (repeatable)')
+    parser.add_argument('--no-resume', action='store_true', help='Ignore any checkpoint and start from the beginning')
+    parser.add_argument('--to-batch-api', metavar='FILE', help='Only convert the input to Azure OpenAI Batch API format')
+    parser.add_argument('--mock', action='store_true', help='Run against a local mock server instead of Azure')
+    parser.add_argument('--mock-error-rate', type=float, default=0.0, help='Fraction of mock requests answered with 429')
+    parser.add_argument('--mock-latency', type=float, default=0.0, help='Seconds of latency added to each mock response')
+
+    args = parser.parse_args()
+    input_path = Path(args.input)
+
+    if args.to_batch_api:
+        try:
+            count = to_batch_api_format(input_path, Path(args.to_batch_api), args.deployment)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"Wrote {count} Batch API requests to {args.to_batch_api}")
+        return 0
+
+    if args.mock:
+        server = start_mock_server(error_rate=args.mock_error_rate, latency=args.mock_latency)
+        endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+        send = build_openai_sender(endpoint, 'mock-key', '2024-10-21')
+        print(f" Using mock server at {endpoint}")
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        send = build_openai_sender(
+            os.getenv('AZURE_OPENAI_ENDPOINT'),
+            os.getenv('AZURE_OPENAI_API_KEY'),
+            os.getenv('AZURE_OPENAI_API_VERSION', '2024-10-21'),
+        )
+
+    runner = BatchRunner(
+        send,
+        concurrency=args.concurrency,
+        max_retries=args.max_retries,
+        rate_limits=parse_rate_limits(args.rate_limit),
+        default_rate_limit={'rpm': args.rpm, 'tpm': args.tpm},
+        backoff_base=0.05 if args.mock else 1.0,
+    )
+    output_path = Path(args.output or input_path.with_suffix('.results.jsonl'))
+
+    print(f" Running {input_path} -> {output_path} (concurrency={args.concurrency})")
+    try:
+        summary = asyncio.run(runner.run(input_path, output_path, args.deployment, resume=not args.no_resume))
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print("\n BATCH RUN SUMMARY")
+    print("=" * 40)
+    for key, value in summary.items():
+        print(f"  {key:25} {value}")
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Fine-Tuning Job Monitor for Azure OpenAI Workshop
+Tracks many fine-tuning jobs concurrently with asyncio, pages job events
+incrementally from the last seen event, backs off adaptively per job state and
+streams training metrics to callbacks.
+"""
+
+import os
+import csv
+import sys
+import time
+import random
+import asyncio
+import inspect
+import argparse
+from pathlib import Path
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Union
+from dataclasses import dataclass, field
+
+
+TERMINAL_STATUSES = {'succeeded', 'failed', 'cancelled'}
+
+# Base polling interval (seconds) per job status; slow phases are polled less often
+STATUS_INTERVALS = {
+    'pending': 60.0,
+    'validating_files': 30.0,
+    'queued': 60.0,
+    'running': 15.0,
+    'notRunning': 60.0,
+}
+DEFAULT_INTERVAL = 30.0
+BACKOFF_FACTOR = 1.5
+EVENT_PAGE_SIZE = 100
+
+Callback = Callable[..., Union[None, Awaitable[None]]]
+
+
+@dataclass
+class JobState:
+    """Polling state for one tracked fine-tuning job"""
+    job_id: str
+    status: str = 'unknown'
+    last_event_id: Optional[str] = None
+    interval: float = DEFAULT_INTERVAL
+    polls: int = 0
+    events_seen: int = 0
+    errors: int = 0
+    job: Any = None
+    metrics: 'MetricsSummary' = field(default_factory=lambda: MetricsSummary())
+
+
+@dataclass
+class MetricsSummary:
+    """Running aggregate of training metrics, updated one row at a time"""
+    steps: int = 0
+    last_step: Optional[int] = None
+    last_train_loss: Optional[float] = None
+    min_train_loss: Optional[float] = None
+    last_valid_loss: Optional[float] = None
+    min_valid_loss: Optional[float] = None
+    last_full_valid_loss: Optional[float] = None
+    min_full_valid_loss: Optional[float] = None
+    best_train_accuracy: Optional[float] = None
+    best_valid_accuracy: Optional[float] = None
+    best_full_valid_accuracy: Optional[float] = None
+
+    def update(self, row: Dict[str, Any]):
+        # results.csv carries every column on every row and leaves the ones not
+        # measured at that step empty. valid_* is measured on a validation batch each
+        # step, full_valid_* on the whole validation set at epoch end; the two are not
+        # comparable, so each is tracked separately
+        step = _to_float(row.get('step'))
+        if step is not None:
+            self.steps += 1
+            self.last_step = int(step)
+        train_loss = _to_float(row.get('train_loss'))
+        if train_loss is not None:
+            self.last_train_loss = train_loss
+            self.min_train_loss = _min(self.min_train_loss, train_loss)
+        valid_loss = _to_float(row.get('valid_loss'))
+        if valid_loss is not None:
+            self.last_valid_loss = valid_loss
+            self.min_valid_loss = _min(self.min_valid_loss, valid_loss)
+        full_valid_loss = _to_float(row.get('full_valid_loss'))
+        if full_valid_loss is not None:
+            self.last_full_valid_loss = full_valid_loss
+            self.min_full_valid_loss = _min(self.min_full_valid_loss, full_valid_loss)
+        train_accuracy = _to_float(row.get('train_mean_token_accuracy'))
+        if train_accuracy is not None:
+            self.best_train_accuracy = _max(self.best_train_accuracy, train_accuracy)
+        valid_accuracy = _to_float(row.get('validation_mean_token_accuracy'))
+        if valid_accuracy is not None:
+            self.best_valid_accuracy = _max(self.best_valid_accuracy, valid_accuracy)
+        full_valid_accuracy = _to_float(row.get('full_valid_mean_token_accuracy'))
+        if full_valid_accuracy is not None:
+            self.best_full_valid_accuracy = _max(self.best_full_valid_accuracy, full_valid_accuracy)
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _min(current: Optional[float], value: float) -> float:
+    return value if current is None else min(current, value)
+
+
+def _max(current: Optional[float], value: float) -> float:
+    return value if current is None else max(current, value)
+
+
+class ResultsParser:
+    """Incremental results.csv parser: feed byte chunks, get back completed rows"""
+
+    def __init__(self):
+        self.header: Optional[List[str]] = None
+        self._pending = b''
+
+    def feed(self, chunk: bytes) -> List[Dict[str, str]]:
+        data = self._pending + chunk
+        cut = data.rfind(b'\n') + 1
+        self._pending = data[cut:]
+        return self._parse(data[:cut])
+
+    def close(self) -> List[Dict[str, str]]:
+        data, self._pending = self._pending, b''
+        return self._parse(data)
+
+    def _parse(self, data: bytes) -> List[Dict[str, str]]:
+        rows = []
+        for values in csv.reader(data.decode('utf-8-sig').splitlines()):
+            if not values:
+                continue
+            if self.header is None:
+                self.header = values
+            else:
+                rows.append(dict(zip(self.header, values)))
+        return rows
+
+
+async def _call(callback: Optional[Callback], *args):
+    """Run a sync or async user callback; its errors are logged so other jobs keep going"""
+    if callback is None:
+        return
+    try:
+        result = callback(*args)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        name = getattr(callback, '__name__', repr(callback))
+        print(f"❌ Error in callback {name}: {e}")
+
+
+class FineTuningMonitor:
+    """Polls many fine-tuning jobs concurrently on an AsyncAzureOpenAI-style client
+
+    ``on_complete(job_id, job, metrics)`` fires once per job, including jobs the
+    monitor gave up on after ``max_errors`` failed polls; their status in
+    ``monitor.jobs`` is ``monitor_error`` and ``job`` may be stale or None.
+    """
+
+    def __init__(
+        self,
+        client,
+        on_event: Optional[Callback] = None,
+        on_metrics: Optional[Callback] = None,
+        on_status_change: Optional[Callback] = None,
+        on_complete: Optional[Callback] = None,
+        on_deploy: Optional[Callback] = None,
+        results_dir: Optional[Path] = None,
+        min_interval: float = 5.0,
+        max_interval: float = 300.0,
+        max_errors: int = 5,
+    ):
+        self.client = client
+        self.on_event = on_event
+        self.on_metrics = on_metrics
+        self.on_status_change = on_status_change
+        self.on_complete = on_complete
+        self.on_deploy = on_deploy
+        self.results_dir = results_dir
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_errors = max_errors
+        self.jobs: Dict[str, JobState] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def base_interval(self, status: str) -> float:
+        interval = STATUS_INTERVALS.get(status, DEFAULT_INTERVAL)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def track(self, job_id: str) -> JobState:
+        """Start monitoring a job; safe to call while the monitor is running"""
+        if job_id not in self.jobs:
+            self.jobs[job_id] = JobState(job_id=job_id, interval=self.min_interval)
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                self._tasks[job_id] = loop.create_task(self._watch(self.jobs[job_id]))
+        return self.jobs[job_id]
+
+    async def run(self, job_ids: Iterable[str] = ()) -> Dict[str, JobState]:
+        """Monitor the given (and any already tracked) jobs until all are terminal"""
+        for job_id in job_ids:
+            self.track(job_id)
+        for job_id, state in self.jobs.items():
+            if job_id not in self._tasks:
+                self._tasks[job_id] = asyncio.create_task(self._watch(state))
+        # Jobs tracked from callbacks while running add new tasks, so loop until none remain
+        while True:
+            pending = [task for task in self._tasks.values() if not task.done()]
+            if not pending:
+                break
+            for task, result in zip(pending, await asyncio.gather(*pending, return_exceptions=True)):
+                if isinstance(result, Exception):
+                    job_id = next(job_id for job_id, job_task in self._tasks.items() if job_task is task)
+                    self.jobs[job_id].status = 'monitor_error'
+                    print(f"❌ Monitor for {job_id} stopped: {result}")
+        return self.jobs
+
+    async def fetch_new_events(self, state: JobState) -> List[Any]:
+        """Events newer than the cursor, oldest first
+
+        The events endpoint lists newest first and pages towards older events,
+        so pages are read only until the last seen event id is reached.
+        """
+        new_events: List[Any] = []
+        after = None
+        while True:
+            kwargs = {'fine_tuning_job_id': state.job_id, 'limit': EVENT_PAGE_SIZE}
+            if after:
+                kwargs['after'] = after
+            page = await self.client.fine_tuning.jobs.list_events(**kwargs)
+            reached_cursor = False
+            for event in page.data:
+                if event.id == state.last_event_id:
+                    reached_cursor = True
+                    break
+                new_events.append(event)
+            if reached_cursor or not page.data or not getattr(page, 'has_more', False):
+                break
+            after = page.data[-1].id
+
+        new_events.reverse()
+        if new_events:
+            state.last_event_id = new_events[-1].id
+            state.events_seen += len(new_events)
+        return new_events
+
+    async def _handle_events(self, state: JobState, events: List[Any]):
+        for event in events:
+            await _call(self.on_event, state.job_id, event)
+            data = getattr(event, 'data', None)
+            if getattr(event, 'type', None) == 'metrics' and data:
+                row = data if isinstance(data, dict) else dict(data)
+                state.metrics.update(row)
+                await _call(self.on_metrics, state.job_id, row)
+
+    async def stream_results(self, state: JobState) -> Optional[Path]:
+        """Download the job's result file in chunks, folding each row into the metrics summary"""
+        result_files = getattr(state.job, 'result_files', None)
+        if not result_files:
+            return None
+
+        path = None
+        handle = None
+        if self.results_dir is not None:
+            self.results_dir.mkdir(parents=True, exist_ok=True)
+            path = self.results_dir / f'results_{state.job_id}.csv'
+            handle = open(path, 'wb')
+
+        # Event metrics are a sample; the result file is the full record, so start over from it
+        state.metrics = MetricsSummary()
+        parser = ResultsParser()
+        try:
+            async with self.client.files.with_streaming_response.content(result_files[0]) as response:
+                async for chunk in response.iter_bytes():
+                    if handle:
+                        handle.write(chunk)
+                    for row in parser.feed(chunk):
+                        state.metrics.update(row)
+                        await _call(self.on_metrics, state.job_id, row)
+            for row in parser.close():
+                state.metrics.update(row)
+                await _call(self.on_metrics, state.job_id, row)
+        finally:
+            if handle:
+                handle.close()
+        return path
+
+    async def _poll(self, state: JobState):
+        job = await self.client.fine_tuning.jobs.retrieve(state.job_id)
+        state.job = job
+        state.polls += 1
+
+        events = await self.fetch_new_events(state)
+        await self._handle_events(state, events)
+
+        if job.status != state.status:
+            previous, state.status = state.status, job.status
+            await _call(self.on_status_change, state.job_id, previous, job.status)
+            state.interval = self.base_interval(job.status)
+        elif events:
+            state.interval = self.base_interval(job.status)
+        else:
+            # Nothing changed since the last poll: back off, with jitter so jobs spread out
+            state.interval = min(self.max_interval, state.interval * BACKOFF_FACTOR)
+        return events
+
+    async def _watch(self, state: JobState):
+        while True:
+            try:
+                await self._poll(state)
+                state.errors = 0
+            except Exception as e:
+                state.errors += 1
+                print(f"❌ Error polling {state.job_id}: {e}")
+                if state.errors >= self.max_errors:
+                    state.status = 'monitor_error'
+                    break
+                state.interval = min(self.max_interval, max(state.interval, self.min_interval) * 2)
+
+            if state.status in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(state.interval * random.uniform(0.9, 1.1))
+
+        if state.status == 'succeeded':
+            try:
+                await self.stream_results(state)
+            except Exception as e:
+                print(f"❌ Error downloading results for {state.job_id}: {e}")
+        await _call(self.on_complete, state.job_id, state.job, state.metrics)
+        if state.status == 'succeeded' and getattr(state.job, 'fine_tuned_model', None):
+            await _call(self.on_deploy, state.job_id, state.job.fine_tuned_model)
+
+
+class FakeFineTuningClient:
+    """In-memory stand-in for AsyncAzureOpenAI fine-tuning endpoints
+
+    Each job walks through validating_files -> queued -> running -> succeeded,
+    advancing one stage per ``retrieve`` call and emitting one metrics event per
+    running poll. Useful for exercising the monitor without an Azure resource.
+    """
+
+    def __init__(self, job_ids: Iterable[str], steps: int = 5, fail: Iterable[str] = ()):
+        self.steps = steps
+        self.fail = set(fail)
+        self.calls = {'retrieve': 0, 'list_events': 0, 'content': 0}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[SimpleNamespace]] = {}
+        self._results: Dict[str, bytes] = {}
+        for job_id in job_ids:
+            self.create(job_id)
+        self.fine_tuning = SimpleNamespace(jobs=SimpleNamespace(retrieve=self._retrieve, list_events=self._list_events))
+        self.files = SimpleNamespace(with_streaming_response=SimpleNamespace(content=self._content))
+
+    def create(self, job_id: str):
+        self._jobs[job_id] = {'stage': 0, 'step': 0}
+        self._events[job_id] = []
+        self._emit(job_id, 'message', 'Job created')
+
+    def _emit(self, job_id: str, event_type: str, message: str, data: Optional[Dict[str, Any]] = None):
+        events = self._events[job_id]
+        events.append(SimpleNamespace(
+            id=f'ftevent-{job_id}-{len(events)}',
+            created_at=int(time.time()),
+            level='info',
+            message=message,
+            type=event_type,
+            data=data,
+        ))
+
+    async def _retrieve(self, job_id: str):
+        self.calls['retrieve'] += 1
+        job = self._jobs[job_id]
+        stages = ['validating_files', 'queued', 'running', 'failed' if job_id in self.fail else 'succeeded']
+        status = stages[job['stage']]
+
+        if status == 'running' and job['step'] < self.steps:
+            job['step'] += 1
+            loss = round(2.0 / job['step'], 4)
+            self._emit(job_id, 'metrics', f"Step {job['step']}: training loss={loss}",
+                       {'step': job['step'], 'train_loss': loss, 'train_mean_token_accuracy': round(1 - loss / 4, 4)})
+        elif status not in TERMINAL_STATUSES:
+            job['stage'] += 1
+            status = stages[job['stage']]
+            self._emit(job_id, 'message', f'Job entered status {status}')
+
+        succeeded = status == 'succeeded'
+        if succeeded and job_id not in self._results:
+            # Same columns as a real results.csv; full_valid_* are only filled at the end of the epoch
+            rows = ['step,train_loss,train_mean_token_accuracy,valid_loss,validation_mean_token_accuracy,'
+                    'full_valid_loss,full_valid_mean_token_accuracy']
+            for s in range(1, self.steps + 1):
+                epoch_end = f'{2.3 / s:.4f},{1 - 0.6 / s:.4f}' if s == self.steps else ','
+                rows.append(f'{s},{2.0 / s:.4f},{1 - 0.5 / s:.4f},{2.2 / s:.4f},{1 - 0.55 / s:.4f},{epoch_end}')
+            self._results[job_id] = ('\n'.join(rows) + '\n').encode('utf-8')
+        return SimpleNamespace(
+            id=job_id,
+            status=status,
+            model='gpt-4.1-mini',
+            fine_tuned_model=f'gpt-4.1-mini.ft-{job_id}' if succeeded else None,
+            result_files=[f'file-{job_id}'] if succeeded else [],
+        )
+
+    async def _list_events(self, fine_tuning_job_id: str, limit: int = 20, after: Optional[str] = None):
+        self.calls['list_events'] += 1
+        events = list(reversed(self._events[fine_tuning_job_id]))
+        if after:
+            ids = [event.id for event in events]
+            events = events[ids.index(after) + 1:]
+        return SimpleNamespace(data=events[:limit], has_more=len(events) > limit)
+
+    @asynccontextmanager
+    async def _content(self, file_id: str):
+        # Mirrors files.with_streaming_response.content: an async context manager
+        # whose response streams the body through an async iter_bytes()
+        self.calls['content'] += 1
+        data = self._results[file_id[len('file-'):]]
+
+        async def iter_bytes(chunk_size: int = 16):
+            for i in range(0, len(data), chunk_size):
+                yield data[i:i + chunk_size]
+
+        yield SimpleNamespace(iter_bytes=iter_bytes)
+
+
+def build_client():
+    """AsyncAzureOpenAI client using the same auth choices as the workshop notebooks"""
+    from dotenv import load_dotenv
+    from openai import AsyncAzureOpenAI
+
+    load_dotenv()
+    endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
+    api_version = os.getenv('AZURE_OPENAI_API_VERSION', '2024-10-21')
+    api_key = os.getenv('AZURE_OPENAI_API_KEY')
+    if api_key:
+        return AsyncAzureOpenAI(azure_endpoint=endpoint, api_key=api_key, api_version=api_version)
+
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
+
+    token_provider = get_bearer_token_provider(DefaultAzureCredential(), 'https://cognitiveservices.azure.com/.default')
+    return AsyncAzureOpenAI(azure_endpoint=endpoint, azure_ad_token_provider=token_provider, api_version=api_version)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Monitor one or more fine-tuning jobs')
+    parser.add_argument('job_ids', nargs='*', help='Fine-tuning job ids to monitor')
+    parser.add_argument('--min-interval', type=float, default=5.0, help='Shortest delay between polls of one job (seconds)')
+    parser.add_argument('--max-interval', type=float, default=300.0, help='Longest delay between polls of one job (seconds)')
+    parser.add_argument('--results-dir', help='Directory to save result CSV files for succeeded jobs')
+    parser.add_argument('--demo', type=int, metavar='N', help='Monitor N simulated jobs against an in-memory fake API')
+
+    args = parser.parse_args()
+
+    if args.demo:
+        job_ids = [f'ftjob-demo{i}' for i in range(args.demo)]
+        client = FakeFineTuningClient(job_ids, fail=job_ids[-1:] if args.demo > 1 else ())
+        min_interval, max_interval = 0.01, 0.05
+    elif args.job_ids:
+        job_ids = args.job_ids
+        client = build_client()
+        min_interval, max_interval = args.min_interval, args.max_interval
+    else:
+        parser.error('provide job ids or --demo N')
+
+    def on_event(job_id, event):
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event.created_at))
+        print(f"[{timestamp}] {job_id} {event.level}: {event.message}")
+
+    def on_complete(job_id, job, metrics):
+        print(f"\n Job {job_id} finished with status: {monitor.jobs[job_id].status}")
+        print(f"  Fine-tuned model: {getattr(job, 'fine_tuned_model', None) or 'N/A'}")
+        print(f"  Steps: {metrics.steps}  Final train loss: {metrics.last_train_loss}  Min valid loss (per step): {metrics.min_valid_loss}")
+        print(f"  Full validation loss: {metrics.last_full_valid_loss}  Best full validation accuracy: {metrics.best_full_valid_accuracy}")
+
+    def on_deploy(job_id, model_id):
+        print(f"  Ready to deploy {model_id} (see deploy_fine_tuned_model in 07-fine_tuning.ipynb)")
+
+    monitor = FineTuningMonitor(
+        client,
+        on_event=on_event,
+        on_complete=on_complete,
+        on_deploy=on_deploy,
+        results_dir=Path(args.results_dir) if args.results_dir else None,
+        min_interval=min_interval,
+        max_interval=max_interval,
+    )
+
+    print(f" Monitoring {len(job_ids)} fine-tuning job(s)...")
+    states = asyncio.run(monitor.run(job_ids))
+
+    print("\n" + "=" * 50)
+    for state in states.values():
+        print(f"  {state.job_id:25} {state.status:12} polls={state.polls:4} events={state.events_seen}")
+
+    return 0 if all(state.status == 'succeeded' for state in states.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Precompiled Prompt Template Store for Azure OpenAI Workshop
+Loads and validates prompt templates once, keeps static content ahead of
+variable content so provider-side prompt caching can reuse the prefix, and
+renders by joining precomputed parts.
+"""
+
+import sys
+import json
+import time
+import hashlib
+import argparse
+import string
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+
+from token_accounting import TOKENS_PER_MESSAGE, count_tokens_batch
+
+
+DEFAULT_PROMPTS_DIR = Path(__file__).resolve().parent.parent / 'legacy' / 'data' / 'prompts'
+# Azure OpenAI only caches prompts whose shared prefix is at least this long
+MIN_CACHEABLE_TOKENS = 1024
+# Static text allowed after the first variable (labels such as "\nOrder: ")
+MAX_STATIC_TAIL_TOKENS = 16
+
+
+@dataclass
+class CompiledTemplate:
+    """A template split into a fixed message prefix and a final parameterised message"""
+    name: str
+    model: Optional[str]
+    prefix_messages: Tuple[Dict[str, str], ...]
+    final_role: str
+    parts: Tuple[str, ...]          # static text, variable name, static text, ...
+    variables: Tuple[str, ...]
+    static_prefix_tokens: int = 0
+    static_tail_tokens: int = 0
+    prefix_hash: str = ''
+    source: Optional[str] = None
+
+    def render(self, **values: Any) -> List[Dict[str, str]]:
+        """Messages for this template; the prefix message dicts are shared, do not mutate them"""
+        if not self.variables:
+            content = self.parts[0]
+        else:
+            try:
+                pieces = [self.parts[0]]
+                for i, name in enumerate(self.variables):
+                    pieces.append(str(values[name]))
+                    pieces.append(self.parts[2 * i + 2])
+            except KeyError as e:
+                raise KeyError(f"Template '{self.name}' is missing value for {e}") from None
+            content = ''.join(pieces)
+        return [*self.prefix_messages, {'role': self.final_role, 'content': content}]
+
+    def cacheable_prefix_ratio(self, variable_tokens: int = 0) -> float:
+        """Share of prompt tokens that sit in the stable, cacheable prefix"""
+        total = self.static_prefix_tokens + self.static_tail_tokens + variable_tokens
+        return self.static_prefix_tokens / total if total else 0.0
+
+    def report(self, variable_tokens: int = 0) -> Dict[str, Any]:
+        return {
+            'template': self.name,
+            'variables': list(self.variables),
+            'static_prefix_tokens': self.static_prefix_tokens,
+            'static_tail_tokens': self.static_tail_tokens,
+            'expected_variable_tokens': variable_tokens,
+            'cacheable_prefix_ratio': round(self.cacheable_prefix_ratio(variable_tokens), 4),
+            'meets_cache_minimum': self.static_prefix_tokens >= MIN_CACHEABLE_TOKENS,
+        }
+
+
+def split_template(text: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """Split ``str.format`` style text into alternating static parts and variable names"""
+    static_parts: List[str] = []
+    variables: List[str] = []
+    pending = ''
+    for literal, name, format_spec, conversion in string.Formatter().parse(text):
+        pending += literal
+        if name is None:
+            continue
+        if not name.isidentifier():
+            raise ValueError(f"Unsupported placeholder '{{{name}}}'; use plain names like {{text}}")
+        if format_spec or conversion:
+            raise ValueError(f"Placeholder '{{{name}}}' must not use format specs or conversions")
+        static_parts.append(pending)
+        variables.append(name)
+        pending = ''
+    static_parts.append(pending)
+
+    parts: List[str] = [static_parts[0]]
+    for name, static in zip(variables, static_parts[1:]):
+        parts.extend([name, static])
+    return tuple(parts), tuple(variables)
+
+
+class TemplateRegistry:
+    """Loads, validates and precompiles prompt templates once per process"""
+
+    def __init__(self, model: Optional[str] = None, max_static_tail_tokens: int = MAX_STATIC_TAIL_TOKENS):
+        self.model = model
+        self.max_static_tail_tokens = max_static_tail_tokens
+        self._templates: Dict[str, CompiledTemplate] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def names(self) -> List[str]:
+        return sorted(self._templates)
+
+    def get(self, name: str) -> CompiledTemplate:
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"Unknown prompt template '{name}'. Available: {', '.join(self.names())}") from None
+
+    def render(self, name: str, **values: Any) -> List[Dict[str, str]]:
+        return self.get(name).render(**values)
+
+    def register(self, name: str, messages: List[Dict[str, str]], source: Optional[str] = None) -> CompiledTemplate:
+        """Compile a template; only the last message may contain ``{placeholders}``"""
+        if not messages:
+            raise ValueError(f"Template '{name}' has no messages")
+        if name in self._templates:
+            raise ValueError(f"Template '{name}' is already registered")
+
+        *prefix, final = messages
+        prefix_messages = []
+        for message in prefix:
+            message_parts, message_variables = split_template(message['content'])
+            if message_variables:
+                raise ValueError(
+                    f"Template '{name}': placeholders are only allowed in the last message, "
+                    f"found one in the '{message['role']}' message. Move variable content to the end "
+                    f"so the static prefix stays cacheable."
+                )
+            # Unescapes {{ and }} so literal JSON in system messages reaches the model as written
+            prefix_messages.append({'role': message['role'], 'content': message_parts[0]})
+        prefix_messages = tuple(prefix_messages)
+        parts, variables = split_template(final['content'])
+        static_parts = parts[0::2]
+
+        # One batched tokenizer pass for every static segment of the template
+        prefix_texts = [text for message in prefix_messages for text in (message['role'], message['content'])]
+        counts = count_tokens_batch(prefix_texts + [final['role'], *static_parts], self.model)
+        prefix_tokens = sum(counts[:len(prefix_texts)]) + TOKENS_PER_MESSAGE * len(prefix)
+        final_role_tokens, head_tokens, *tail_counts = counts[len(prefix_texts):]
+        tail_tokens = sum(tail_counts)
+
+        if tail_tokens > self.max_static_tail_tokens:
+            raise ValueError(
+                f"Template '{name}' has {tail_tokens} tokens of static text after its first "
+                f"placeholder (limit {self.max_static_tail_tokens}). Put instructions before the "
+                f"variable content so they form part of the cacheable prefix."
+            )
+
+        # The head of the final message precedes every variable, so it is part of the cacheable prefix
+        prefix_key = json.dumps([*prefix_messages, {'role': final['role'], 'content': parts[0]}], sort_keys=True)
+        template = CompiledTemplate(
+            name=name,
+            model=self.model,
+            prefix_messages=prefix_messages,
+            final_role=final['role'],
+            parts=parts,
+            variables=variables,
+            static_prefix_tokens=prefix_tokens + TOKENS_PER_MESSAGE + final_role_tokens + head_tokens,
+            static_tail_tokens=tail_tokens,
+            prefix_hash=hashlib.sha256(prefix_key.encode('utf-8')).hexdigest()[:16],
+            source=source,
+        )
+        self._templates[name] = template
+        return template
+
+    def load_file(self, path: Path, name: Optional[str] = None) -> CompiledTemplate:
+        """Load a ``System:`` / ``Prompt:`` prompt file as used in legacy/data/prompts"""
+        text = path.read_text(encoding='utf-8')
+        system, marker, prompt = text.partition('Prompt:')
+        if not marker:
+            raise ValueError(f"{path}: expected a 'Prompt:' section")
+        system = system.strip()
+        if system.startswith('System:'):
+            system = system[len('System:'):].strip()
+        messages = [{'role': 'system', 'content': system}] if system else []
+        messages.append({'role': 'user', 'content': prompt.strip()})
+        return self.register(name or path.stem, messages, source=str(path))
+
+    def load_directory(self, directory: Path = DEFAULT_PROMPTS_DIR) -> List[CompiledTemplate]:
+        """Load every ``*.txt`` prompt file in a directory"""
+        return [self.load_file(path) for path in sorted(directory.glob('*.txt'))]
+
+
+def benchmark(registry: TemplateRegistry, iterations: int = 10000) -> List[Dict[str, Any]]:
+    """Compare precompiled rendering against re-reading and formatting each call"""
+    results = []
+    for name in registry.names():
+        template = registry.get(name)
+        samples = [{var: f'sample value {i} for {var}' for var in template.variables} for i in range(iterations)]
+
+        start = time.perf_counter()
+        rendered = [template.render(**values) for values in samples]
+        precompiled = (time.perf_counter() - start) / iterations
+
+        naive = None
+        if template.source:
+            start = time.perf_counter()
+            for values in samples:
+                text = Path(template.source).read_text(encoding='utf-8')
+                system, _, prompt = text.partition('Prompt:')
+                [{'role': 'system', 'content': system.strip()[len('System:'):].strip()},
+                 {'role': 'user', 'content': prompt.strip().format(**values)}]
+            naive = (time.perf_counter() - start) / iterations
+
+        # Every render must produce a byte-identical prefix for the cache to hit: hash what
+        # was actually rendered up to the end of the final message's static head
+        prefix_hashes = set()
+        head_length = len(template.parts[0])
+        for messages in rendered[:1000]:
+            final = messages[-1]
+            if not final['content'].startswith(template.parts[0]):
+                prefix_hashes.add(None)
+                continue
+            head = [*messages[:-1], {'role': final['role'], 'content': final['content'][:head_length]}]
+            prefix_hashes.add(hashlib.sha256(json.dumps(head, sort_keys=True).encode('utf-8')).hexdigest()[:16])
+
+        results.append({
+            'template': name,
+            'render_us': round(precompiled * 1e6, 3),
+            'naive_render_us': round(naive * 1e6, 3) if naive is not None else None,
+            'prefix_stable': prefix_hashes == {template.prefix_hash},
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load, validate and report on prompt templates')
+    parser.add_argument('directory', nargs='?', default=str(DEFAULT_PROMPTS_DIR), help='Directory of System:/Prompt: template files')
+    parser.add_argument('--model', default='gpt-4.1-mini', help='Model used for token counts')
+    parser.add_argument('--variable-tokens', type=int, default=50, help='Expected tokens of variable content per request')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Time N renders per template and check prefix stability')
+    parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format')
+
+    args = parser.parse_args()
+
+    registry = TemplateRegistry(model=args.model)
+    registry.load_directory(Path(args.directory))
+    reports = [registry.get(name).report(args.variable_tokens if registry.get(name).variables else 0)
+               for name in registry.names()]
+    bench = benchmark(registry, args.benchmark) if args.benchmark else []
+
+    if args.format == 'json':
+        print(json.dumps({'templates': reports, 'benchmark': bench}, indent=2))
+        return 0
+
+    print(" PROMPT TEMPLATE REPORT")
+    print("=" * 60)
+    for report in reports:
+        print(f"  {report['template']}")
+        print(f"    Variables: {', '.join(report['variables']) or 'none'}")
+        print(f"    Static prefix tokens: {report['static_prefix_tokens']}  Static tail tokens: {report['static_tail_tokens']}")
+        print(f"    Cacheable prefix ratio: {report['cacheable_prefix_ratio']:.1%}"
+              f"{'' if report['meets_cache_minimum'] else f'  (below {MIN_CACHEABLE_TOKENS}-token cache minimum)'}")
+    if bench:
+        print("\n BENCHMARK")
+        print("-" * 60)
+        for result in bench:
+            naive = f"{result['naive_render_us']} us" if result['naive_render_us'] is not None else 'n/a'
+            print(f"  {result['template']:20} render={result['render_us']} us  naive={naive}  prefix_stable={result['prefix_stable']}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
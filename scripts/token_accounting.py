@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Token and Cost Accounting for Azure OpenAI Workshop
+Shared, cached tokenizers plus batch token counting and vectorized cost
+estimation, for use before a request is sent (rate limiting, routing, budgets).
+"""
+
+import sys
+import json
+import math
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import tiktoken
+
+
+DEFAULT_ENCODING = 'o200k_base'
+DEFAULT_THREADS = 8
+# Below this many uncached texts, plain encode() is cheaper than starting encode_batch's thread pool
+BATCH_ENCODE_MIN = 32
+COUNT_CACHE_SIZE = 100_000
+
+# Chat-format overhead: every message is wrapped in <|start|>{role}\n...<|end|>,
+# a name field costs one extra token, and the reply is primed with <|start|>assistant
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+# Approximate USD prices per 1M tokens (input, output); check the Azure pricing page for your region.
+# Names match exactly or as a prefix followed by '-' (e.g. dated versions); anything else,
+# including free-form deployment names, has unknown (NaN) cost.
+PRICING_PER_MILLION: Dict[str, Tuple[float, float]] = {
+    'gpt-4.1-nano': (0.10, 0.40),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4-32k': (60.00, 120.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-35-turbo': (0.50, 1.50),
+    'text-embedding-3-small': (0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None) -> tiktoken.Encoding:
+    """Process-wide cached encoder for a model or deployment name"""
+    if not model:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Deployment names are free-form; fall back to the current default encoding
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+
+
+class TokenCountCache:
+    """Thread-safe LRU of token counts keyed by encoding and content hash"""
+
+    def __init__(self, max_size: int = COUNT_CACHE_SIZE):
+        self.max_size = max_size
+        self._counts: 'OrderedDict[Tuple[str, bytes], int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(encoding_name: str, text: str) -> Tuple[str, bytes]:
+        return encoding_name, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key: Tuple[str, bytes]) -> Optional[int]:
+        with self._lock:
+            count = self._counts.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._counts.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: Tuple[str, bytes], count: int):
+        with self._lock:
+            self._counts[key] = count
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_size:
+                self._counts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_count_cache = TokenCountCache()
+
+
+def count_tokens_batch(texts: List[str], model: Optional[str] = None, num_threads: int = DEFAULT_THREADS) -> List[int]:
+    """Token counts for many texts; only uncached texts are encoded, large batches on threads"""
+    encoding = get_encoding(model)
+    keys = [TokenCountCache.key(encoding.name, text) for text in texts]
+    counts: List[Optional[int]] = [_count_cache.get(key) for key in keys]
+
+    missing: Dict[Tuple[str, bytes], List[int]] = {}
+    for i, count in enumerate(counts):
+        if count is None:
+            missing.setdefault(keys[i], []).append(i)
+
+    if missing:
+        positions = list(missing.values())
+        uncached = [texts[indexes[0]] for indexes in positions]
+        if len(uncached) < BATCH_ENCODE_MIN:
+            encoded = [encoding.encode(text, disallowed_special=()) for text in uncached]
+        else:
+            encoded = encoding.encode_batch(uncached, num_threads=num_threads, disallowed_special=())
+        for indexes, tokens in zip(positions, encoded):
+            _count_cache.put(keys[indexes[0]], len(tokens))
+            for i in indexes:
+                counts[i] = len(tokens)
+
+    return counts
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count for a single text (memoized)"""
+    return count_tokens_batch([text], model)[0]
+
+
+def _message_text(content: Any) -> str:
+    if content is None:
+        return ''
+    if isinstance(content, list):
+        return ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def count_chat_tokens_batch(conversations: List[List[Dict[str, Any]]], model: Optional[str] = None) -> List[int]:
+    """Prompt tokens for many message lists, including chat-format overhead"""
+    texts: List[str] = []
+    overheads: List[int] = []
+    spans: List[Tuple[int, int]] = []
+    for messages in conversations:
+        start = len(texts)
+        overhead = TOKENS_PER_REPLY
+        for message in messages:
+            overhead += TOKENS_PER_MESSAGE
+            texts.append(message.get('role', ''))
+            texts.append(_message_text(message.get('content')))
+            if message.get('name'):
+                overhead += TOKENS_PER_NAME
+                texts.append(message['name'])
+        spans.append((start, len(texts)))
+        overheads.append(overhead)
+
+    counts = count_tokens_batch(texts, model)
+    return [sum(counts[start:end]) + overhead for (start, end), overhead in zip(spans, overheads)]
+
+
+def count_chat_tokens(messages: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+    """Prompt tokens for one message list, including chat-format overhead"""
+    return count_chat_tokens_batch([messages], model)[0]
+
+
+@lru_cache(maxsize=1024)
+def resolve_pricing(model: str) -> Tuple[float, float]:
+    """Per-token (input, output) price for a model; NaN for models without a pricing entry"""
+    name = model.lower()
+    for known in sorted(PRICING_PER_MILLION, key=len, reverse=True):
+        if name == known or name.startswith(known + '-'):
+            input_price, output_price = PRICING_PER_MILLION[known]
+            return input_price / 1_000_000, output_price / 1_000_000
+    return math.nan, math.nan
+
+
+def calculate_cost(prompt_tokens: int, completion_tokens: int, model: str = 'gpt-4.1-mini') -> float:
+    """Approximate USD cost for one request; NaN when the model's price is unknown"""
+    input_price, output_price = resolve_pricing(model)
+    return prompt_tokens * input_price + completion_tokens * output_price
+
+
+def estimate_request_cost(messages: List[Dict[str, Any]], model: str, max_completion_tokens: int = 0) -> float:
+    """Upper-bound cost of a chat request before it is sent"""
+    return calculate_cost(count_chat_tokens(messages, model), max_completion_tokens, model)
+
+
+def estimate_costs(df, model: Optional[str] = None, model_column: str = 'model',
+                   prompt_column: str = 'prompt_tokens', completion_column: str = 'completion_tokens'):
+    """Vectorized cost per row of a DataFrame of token counts
+
+    Rows with an unknown or missing model, or a missing token count, cost NaN so they
+    are never silently under-counted; an absent token column counts as zero tokens.
+    """
+    import pandas as pd
+
+    if model is not None:
+        input_price, output_price = resolve_pricing(model)
+    else:
+        models = df[model_column]
+        prices = {name: resolve_pricing(name) for name in models.unique() if isinstance(name, str)}
+        # Names without a pricing entry (NaN, None, numbers) map to NaN
+        input_price = models.map({name: price[0] for name, price in prices.items()})
+        output_price = models.map({name: price[1] for name, price in prices.items()})
+
+    prompt_tokens = df[prompt_column] if prompt_column in df else 0
+    completion_tokens = df[completion_column] if completion_column in df else 0
+    return pd.Series(prompt_tokens * input_price + completion_tokens * output_price, index=df.index, name='cost_usd')
+
+
+def add_token_counts(df, text_column: str, model: Optional[str] = None, output_column: str = 'prompt_tokens'):
+    """Count tokens for a text column in one batch and store them in ``output_column``"""
+    df[output_column] = count_tokens_batch(df[text_column].fillna('').astype(str).tolist(), model)
+    return df
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit/miss counters for the shared token count cache"""
+    return {'hits': _count_cache.hits, 'misses': _count_cache.misses, 'entries': len(_count_cache._counts)}
+
+
+def iter_jsonl_messages(path: Path) -> Iterable[Tuple[str, List[Dict[str, Any]]]]:
+    """Yield (model, messages) from a chat or fine-tuning JSONL file"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = record.get('body', record)
+            yield body.get('model'), body.get('messages', [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate prompt tokens and cost for a JSONL file of chat requests')
+    parser.add_argument('path', help='JSONL file with a "messages" list per line (chat, Batch API or fine-tuning format)')
+    parser.add_argument('--model', default='gpt-4.1-mini', help='Model used for tokenization and pricing when a line has none')
+    parser.add_argument('--max-completion-tokens', type=int, default=0, help='Completion tokens to budget per request')
+
+    args = parser.parse_args()
+
+    by_model: Dict[str, List[List[Dict[str, Any]]]] = {}
+    for model, messages in iter_jsonl_messages(Path(args.path)):
+        by_model.setdefault(model or args.model, []).append(messages)
+
+    print(" TOKEN AND COST ESTIMATE")
+    print("=" * 50)
+    total_cost = 0.0
+    unpriced = []
+    for model, conversations in by_model.items():
+        prompt_tokens = sum(count_chat_tokens_batch(conversations, model))
+        completion_tokens = args.max_completion_tokens * len(conversations)
+        cost = calculate_cost(prompt_tokens, completion_tokens, model)
+        if math.isnan(cost):
+            unpriced.append(model)
+            cost_text = 'unknown price'
+        else:
+            total_cost += cost
+            cost_text = f'${cost:.4f}'
+        print(f"  {model:25} requests={len(conversations):6} prompt_tokens={prompt_tokens:9} cost={cost_text}")
+    print(f"\n  Total estimated cost: ${total_cost:.4f}")
+    if unpriced:
+        print(f"  Not included (no pricing entry): {', '.join(unpriced)}")
+    print(f"  Token cache: {cache_stats()}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())